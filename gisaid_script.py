@@ -1,8 +1,11 @@
 #! /usr/bin/python
 
 import argparse
+import contextlib
 import datetime
+import io
 import logging
+import mmap
 import os
 import pathlib
 import re
@@ -12,9 +15,9 @@ import sys
 import numpy as np
 import pandas as pd
 from Bio import SeqIO
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from glob import glob
-from IPython.display import display
 from logging.handlers import RotatingFileHandler
 
 # from tqdm import tqdm
@@ -102,6 +105,18 @@ parser.add_argument(
     dest="no_auto_qc",
     default=False,
 )
+parser.add_argument(
+    "--dedup_by",
+    help=(
+        "Metrics used, in order of priority, to pick the best assembly "
+        "when a sample was sequenced more than once: 'coverage' "
+        "and/or 'analysis_date' (the date the Terra workflow was run)"
+    ),
+    nargs="*",
+    choices=["coverage", "analysis_date"],
+    dest="dedup_by",
+    default=["coverage", "analysis_date"],
+)
 
 user_args = vars(parser.parse_args())
 INDIR = user_args.get("indir")
@@ -134,8 +149,21 @@ VOC_LIST = user_args.get("voc_list")
 GSUTIL_PATH = user_args.get("gsutil_path")
 NO_AUTO_QC = user_args.get("no_auto_qc")
 WORKFLOW = user_args.get("workflow").lower()
+DEDUP_BY = user_args.get("dedup_by")
 
 ASSEMBLY_DIR = os.path.join(OUTDIR, "assemblies")
+ASSEMBLY_STORE = os.path.join(ASSEMBLY_DIR, "assemblies.dat")
+ASSEMBLY_INDEX = os.path.join(ASSEMBLY_DIR, "assemblies_index.tsv")
+EVENT_TYPES = (
+    "missing_wa_no",
+    "duplicate",
+    "missing_data",
+    "qc_fail",
+    "download_fail",
+    "fasta_fail",
+    "voc_hit",
+    "voi_hit",
+)
 EXTENSION_HANDLERS = {
     ".csv": pd.read_csv,
     ".tsv": partial(pd.read_csv, sep="\t"),
@@ -161,6 +189,44 @@ def setup_logger(output_dir):
     return logger
 
 
+class SampleEvents:
+    """Collects per-sample events (missing data, QC failures, download 
+    failures, VOC/VOI hits, etc.) in columnar form, for reporting"""
+
+    def __init__(self):
+        self.columns = {"sample": [], "event": [], "detail": []}
+
+    def add(self, event: str, samples: list, detail: str = ""):
+        samples = [str(sample) for sample in samples]
+        self.columns["sample"].extend(samples)
+        self.columns["event"].extend([event] * len(samples))
+        self.columns["detail"].extend([detail] * len(samples))
+
+    def to_frame(self) -> pd.DataFrame:
+        events_df = pd.DataFrame(self.columns)
+        events_df["event"] = pd.Categorical(events_df["event"], categories=EVENT_TYPES)
+        return events_df
+
+    def counts(self) -> pd.Series:
+        """Returns the number of unique samples affected by each event"""
+        return (
+            self.to_frame()
+            .groupby("event", observed=False)["sample"]
+            .nunique()
+            .rename("samples")
+        )
+
+
+def write_reports(events: SampleEvents):
+    """Writes the table of per-sample events as TSV and JSON, along with 
+    an HTML summary of the number of samples affected by each event"""
+    events_df = events.to_frame()
+    summary_df = events.counts().to_frame()
+    events_df.to_csv(os.path.join(OUTDIR, "sample_events.tsv"), sep="\t", index=False)
+    events_df.to_json(os.path.join(OUTDIR, "sample_events.json"), orient="records")
+    summary_df.to_html(os.path.join(OUTDIR, "sample_events_summary.html"))
+
+
 def load_tables(table_list, terra_table=False):
     """Load input tables and consolidate into pandas DataFrames"""
 
@@ -185,19 +251,20 @@ def load_tables(table_list, terra_table=False):
 
 
 def merge_tables(
-    terra_df: pd.DataFrame, dashboard_df: pd.DataFrame, logger: logging.Logger
+    terra_df: pd.DataFrame,
+    dashboard_df: pd.DataFrame,
+    events: SampleEvents,
+    logger: logging.Logger,
 ):
     """Merges the Dashboard and Terra tables, and reformats slightly"""
     pattern = ".*(WA[0-9]{7}).*"
     terra_df["wa_no"] = terra_df["sample_name"].str.extract(pattern)
     missing_wa_nos = terra_df[terra_df["wa_no"].isna()]["sample_name"].tolist()
     if len(missing_wa_nos) > 0:
-        missing_wa_nos_msg = "\n".join(
-            [
-                ("No WA number could be determined for the following " "samples: "),
-                *missing_wa_nos,
-                "and they will be omitted from the outputs",
-            ]
+        events.add("missing_wa_no", missing_wa_nos)
+        missing_wa_nos_msg = (
+            f"No WA number could be determined for {len(missing_wa_nos)} "
+            "samples, and they will be omitted from the outputs"
         )
         logger.warning(missing_wa_nos_msg)
         print()
@@ -220,6 +287,7 @@ def get_column_map(workflow: str):
         "ivar_version",
         "nextclade_clade",
         "pangolin_lineage",
+        "analysis_date",
     )
     titan_col_names = (
         "assembly_fasta",
@@ -227,6 +295,7 @@ def get_column_map(workflow: str):
         "ivar_version_consensus",
         "nextclade_clade",
         "pango_lineage",
+        "titan_illumina_pe_analysis_date",
     )
     lang_col_names = (
         "consensus_seq",
@@ -234,6 +303,7 @@ def get_column_map(workflow: str):
         "ivar_version_consensus",
         "nextclade_clade",
         "pangolin_lineage",
+        "analysis_date",
     )
     workflow_cols = dict()
     for key, col_names in zip(("titan", "lang"), (titan_col_names, lang_col_names)):
@@ -243,45 +313,173 @@ def get_column_map(workflow: str):
     return workflow_cols[workflow]
 
 
-def auto_qc(merged_df: pd.DataFrame, logger: logging.Logger):
+def resolve_duplicates(
+    merged_df: pd.DataFrame,
+    dedup_by: list,
+    events: SampleEvents,
+    logger: logging.Logger,
+):
+    """For samples sequenced more than once, keeps only the best assembly 
+    per WA number, ranked by the metrics in `dedup_by` (highest value, or 
+    latest date, first); returns the deduplicated DataFrame along with 
+    the rows that were dropped"""
+    converters = {
+        "coverage": partial(pd.to_numeric, errors="coerce"),
+        "analysis_date": partial(pd.to_datetime, errors="coerce"),
+    }
+    ranking_df = merged_df[["wa_no"]].copy()
+    sort_keys = list()
+    for metric in dedup_by:
+        col = col_names.get(metric)
+        if metric not in converters or col not in merged_df.columns:
+            logger.warning(
+                f"Cannot rank duplicate samples by '{metric}'; "
+                "no matching column found in input Terra tables"
+            )
+            continue
+        ranking_df[metric] = converters[metric](merged_df[col])
+        sort_keys.append(metric)
+
+    # Stable sort, so that ties fall back to the order of the input tables
+    if len(sort_keys) > 0:
+        ranking_df = ranking_df.sort_values(
+            sort_keys, ascending=False, na_position="last", kind="mergesort"
+        )
+    dropped_index = ranking_df[ranking_df.duplicated(subset="wa_no")].index
+    dropped_df = merged_df.loc[dropped_index]
+    deduped_df = merged_df.drop(index=dropped_index)
+
+    if dropped_df.shape[0] > 0:
+        report_cols = ["wa_no", "sample_name", col_names.get("sequence")] + [
+            col_names.get(metric) for metric in sort_keys
+        ]
+        outpath = os.path.join(OUTDIR, "duplicate_samples.tsv")
+        dropped_df[report_cols].to_csv(outpath, sep="\t", index=False)
+        duplicated_samples = dropped_df["wa_no"].drop_duplicates().tolist()
+        events.add("duplicate", duplicated_samples, detail=", ".join(sort_keys))
+        duplicates_msg = (
+            f"{len(duplicated_samples)} samples were sequenced more than once; "
+            f"only the best assembly (ranked by {sort_keys}) will be used in "
+            f"the outputs. The omitted duplicates were written to {outpath}"
+        )
+        logger.warning(duplicates_msg)
+        print()
+    return deduped_df, dropped_df
+
+
+def auto_qc(merged_df: pd.DataFrame, events: SampleEvents, logger: logging.Logger):
     conditions = merged_df[col_names.get("coverage")] < 60
     key_metrics = [col_names.get("coverage")]
     bad_samples = merged_df[conditions]["wa_no"].dropna().tolist()
     if len(bad_samples) > 0:
-        auto_qc_msg = "\n".join(
-            [
-                (
-                    "The following samples failed to meet the minimum QC metrics "
-                    f"set for genome quality (currently {key_metrics})"
-                ),
-                *bad_samples,
-                "and will be omitted from the outputs",
-            ]
+        events.add("qc_fail", bad_samples, detail=", ".join(key_metrics))
+        auto_qc_msg = (
+            f"{len(bad_samples)} samples failed to meet the minimum QC metrics "
+            f"set for genome quality (currently {key_metrics}) and will be "
+            "omitted from the outputs"
         )
         logger.warning(auto_qc_msg)
         print()
     return bad_samples
 
 
+def load_store_index():
+    """Reads the offset/length index of the packed assembly store, keyed 
+    by (WA number, source URL); incomplete entries, or entries pointing 
+    past the end of the data file (e.g. from an interrupted run), are 
+    discarded, and an empty or unreadable index is treated as empty"""
+    if not (os.path.exists(ASSEMBLY_INDEX) and os.path.exists(ASSEMBLY_STORE)):
+        return dict()
+    store_size = os.path.getsize(ASSEMBLY_STORE)
+    with open(ASSEMBLY_INDEX, "r") as index_buffer:
+        index_text = index_buffer.read()
+    # A last row without its newline was cut short while being written
+    if not index_text.endswith("\n"):
+        index_text = index_text[: index_text.rfind("\n") + 1]
+    try:
+        index_df = (
+            pd.read_csv(
+                io.StringIO(index_text), sep="\t", dtype={"wa_no": str, "url": str}
+            )
+            .dropna()
+            .astype({"offset": np.int64, "length": np.int64})
+        )
+    except (pd.errors.EmptyDataError, pd.errors.ParserError, KeyError, ValueError):
+        return dict()
+    index_df = index_df[index_df["offset"] + index_df["length"] <= store_size]
+    return {
+        (wa_no, url): (offset, length)
+        for wa_no, url, offset, length in index_df[
+            ["wa_no", "url", "offset", "length"]
+        ].itertuples(index=False)
+    }
+
+
+def write_store_index(store_index: dict):
+    """Writes the offset/length index of the packed assembly store, via a 
+    temporary file so that an interrupted write leaves the old index intact"""
+    index_df = pd.DataFrame(
+        [(*key, *value) for key, value in store_index.items()],
+        columns=["wa_no", "url", "offset", "length"],
+    )
+    tmp_path = f"{ASSEMBLY_INDEX}.tmp"
+    index_df.to_csv(tmp_path, sep="\t", index=False)
+    os.replace(tmp_path, ASSEMBLY_INDEX)
+
+
+@contextlib.contextmanager
+def read_assembly_store():
+    """Yields a read-only memoryview of the packed assembly store"""
+    if not os.path.exists(ASSEMBLY_STORE) or os.path.getsize(ASSEMBLY_STORE) == 0:
+        yield memoryview(b"")
+        return
+    with open(ASSEMBLY_STORE, "rb") as store_buffer:
+        with mmap.mmap(store_buffer.fileno(), 0, access=mmap.ACCESS_READ) as store_map:
+            with memoryview(store_map) as store_view:
+                yield store_view
+
+
 def download_assemblies(merged_df: pd.DataFrame):
     """For each sample represented in the Terra results, attempts to 
-    download the corresponding genome assembly"""
+    download the corresponding genome assembly, appending it to the 
+    packed assembly store; assemblies already in the store from a 
+    previous run are not downloaded again"""
 
     pathlib.Path(ASSEMBLY_DIR).mkdir(exist_ok=True, parents=True)
     pipes = {key: subprocess.PIPE for key in ("stdout", "stderr")}
-    download_stdouts, download_stderrs = dict(), dict()
+    store_index = load_store_index()
+    # Drop any stale entries, then append to the index as each download
+    # lands, so that an interrupted run can still be resumed
+    write_store_index(store_index)
+    download_stderrs = dict()
 
-    def gsutil_download(row):
+    def gsutil_download(row, store_buffer, index_buffer):
         wa_no, url = row[0], row[1]
-        cmd = f"{GSUTIL_PATH} cp {url} {ASSEMBLY_DIR}"
+        if (wa_no, url) in store_index:
+            return
+        cmd = f"{GSUTIL_PATH} cat {url}"
         proc = subprocess.Popen(shlex.split(cmd), **pipes)
         stdout, stderr = proc.communicate()
-        download_stdouts.update({wa_no: stdout.decode("utf-8")})
         download_stderrs.update({wa_no: stderr.decode("utf-8")})
+        if proc.returncode == 0 and len(stdout) > 0:
+            offset = store_buffer.seek(0, os.SEEK_END)
+            store_buffer.write(stdout)
+            store_buffer.flush()
+            store_index[(wa_no, url)] = (offset, len(stdout))
+            index_buffer.write(f"{wa_no}\t{url}\t{offset}\t{len(stdout)}\n")
+            index_buffer.flush()
+
+    with open(ASSEMBLY_STORE, "ab") as store_buffer, open(
+        ASSEMBLY_INDEX, "a"
+    ) as index_buffer:
+        _ = merged_df[["wa_no", col_names.get("sequence")]].apply(
+            gsutil_download,
+            axis=1,
+            store_buffer=store_buffer,
+            index_buffer=index_buffer,
+        )
 
-    _ = merged_df[["wa_no", col_names.get("sequence")]].apply(gsutil_download, axis=1)
-
-    return download_stdouts, download_stderrs
+    return store_index, download_stderrs
 
 
 def handle_counties(county: str):
@@ -376,71 +574,68 @@ def prep_metadata(df: pd.DataFrame):
     return new_output_df
 
 
-def generate_fasta(merged_df: pd.DataFrame, logger: logging.Logger):
-    """Gather assemblies and output with new header lines"""
+def generate_fasta(
+    merged_df: pd.DataFrame,
+    store_index: dict,
+    events: SampleEvents,
+    logger: logging.Logger,
+):
+    """Gather assemblies from the packed store and output with new 
+    header lines"""
     file_df = (
         merged_df[["wa_no", "seq_id", col_names.get("sequence")]]
         .copy()
         .sort_values("seq_id")
     )
-
-    seq_id_pattern = r".*/(?:call-consensus|cacheCopy)/(.*)"
-    file_df["consensus_file"] = (
-        ASSEMBLY_DIR
-        + os.sep
-        + file_df[col_names.get("sequence")].fillna("").str.extract(seq_id_pattern)
-    )
     fasta_generation_errs = dict()
 
-    def gather_seqs(row, out_buffer):
+    def gather_seqs(row, out_buffer, store_view):
         try:
-            with open(row["consensus_file"], "r") as seq_buffer:
-                rec = next(SeqIO.parse(seq_buffer, "fasta"))
-                rec.id = row["seq_id"]
-                rec.description = ""
-                SeqIO.write(rec, out_buffer, "fasta")
-        except (TypeError, AttributeError, FileNotFoundError) as err:
+            key = (row["wa_no"], row[col_names.get("sequence")])
+            offset, length = store_index[key]
+            with store_view[offset : offset + length] as seq_view:
+                seq_buffer = io.StringIO(seq_view.tobytes().decode("utf-8"))
+            rec = next(SeqIO.parse(seq_buffer, "fasta"))
+            rec.id = row["seq_id"]
+            rec.description = ""
+            SeqIO.write(rec, out_buffer, "fasta")
+        except (TypeError, AttributeError, KeyError, StopIteration) as err:
             fasta_generation_errs[row["wa_no"]] = err
             pass
 
     all_seq_path = os.path.join(OUTDIR, "all_sequences.fa")
-    with open(all_seq_path, "w") as out_buffer:
+    with read_assembly_store() as store_view, open(all_seq_path, "w") as out_buffer:
         _ = file_df.dropna(subset=["wa_no"]).apply(
-            gather_seqs, axis=1, out_buffer=out_buffer
+            gather_seqs, axis=1, out_buffer=out_buffer, store_view=store_view
         )
     logger.info(f"Consolidated genome assemblies written to {all_seq_path}")
     if len(fasta_generation_errs) > 0:
-        fasta_generation_msg = "\n".join(
-            [
-                (
-                    "There were problems with gathering/renaming the "
-                    "genome sequences for the following samples, and they "
-                    "were omitted from the outputs:"
-                ),
-                *fasta_generation_errs.keys(),
-            ]
+        for sample, err in fasta_generation_errs.items():
+            events.add("fasta_fail", [sample], detail=repr(err))
+        fasta_generation_msg = (
+            "There were problems with gathering/renaming the genome "
+            f"sequences for {len(fasta_generation_errs)} samples, and they "
+            "were omitted from the outputs"
         )
         logger.warning(fasta_generation_msg)
         print()
     return fasta_generation_errs
 
 
-def handle_missing_data(df: pd.DataFrame, req_fields: list, logger: logging.Logger):
+def handle_missing_data(
+    df: pd.DataFrame, req_fields: list, events: SampleEvents, logger: logging.Logger
+):
     samples_missing_data = list()
     working_df = df.copy().set_index("wa_no")[req_fields]  # .astype(str)
     for req_field in req_fields:
         missing_mask = working_df[req_field].replace("", None).isna()
-        samples_missing_data.extend(working_df[missing_mask].index.astype(str).tolist())
+        missing_samples = working_df[missing_mask].index.astype(str).tolist()
+        events.add("missing_data", missing_samples, detail=req_field)
+        samples_missing_data.extend(missing_samples)
     if len(samples_missing_data) > 0:
-        missing_data_msg = "\n".join(
-            [
-                (
-                    "The following samples are missing data in the required "
-                    f"fields {req_fields}:"
-                ),
-                *samples_missing_data,
-                ("and will be omitted from the outputs."),
-            ]
+        missing_data_msg = (
+            f"{len(set(samples_missing_data))} samples are missing data in the "
+            f"required fields {req_fields}, and will be omitted from the outputs."
         )
         logger.warning(missing_data_msg)
         print()
@@ -448,7 +643,10 @@ def handle_missing_data(df: pd.DataFrame, req_fields: list, logger: logging.Logg
 
 
 def handle_missing_genomes(
-    df: pd.DataFrame, download_stderrs: dict, logger: logging.Logger
+    df: pd.DataFrame,
+    download_stderrs: dict,
+    events: SampleEvents,
+    logger: logging.Logger,
 ):
     """Detects errors that occur when downloading genomes, 
     and prints/logs messages warning the user they will be 
@@ -461,15 +659,13 @@ def handle_missing_genomes(
         if ("AccessDeniedException" in msg) or ("CommandException" in msg):
             download_failures.append(sample)
             download_failure_msgs.append(msg)
+            events.add("download_fail", [sample], detail=msg.strip())
 
     if len(download_failures) > 0:
-        download_failures_msg = "\n".join(
-            [
-                "NOTE: the following sequences could not "
-                "be downloaded successfully and will be omitted "
-                "from the outputs: ",
-                "\n".join(sample for sample in download_failures),
-            ]
+        download_failures_msg = (
+            f"NOTE: {len(download_failures)} sequences could not "
+            "be downloaded successfully and will be omitted "
+            "from the outputs"
         )
         logger.warning(download_failures_msg)
         print()
@@ -486,7 +682,7 @@ def handle_missing_genomes(
         url_msg = (
             f"Please check formatting of '{col_names.get('sequence')}' "
             "column in input Terra tables for samples "
-            "listed above."
+            "listed in the sample events report."
         )
         logger.warning(url_msg)
         print()
@@ -509,9 +705,16 @@ def get_vocs():
     return vocs, vois
 
 
-def handle_vocs(vocs: list, vois: list, terra_df: pd.DataFrame, logger: logging.Logger):
+def handle_vocs(
+    vocs: list,
+    vois: list,
+    terra_df: pd.DataFrame,
+    events: SampleEvents,
+    report_executor: ThreadPoolExecutor,
+    logger: logging.Logger,
+):
     if len(vocs) == 0 and len(vois) == 0:
-        return [], []
+        return [], [], None
     clades = (
         terra_df[
             [
@@ -534,49 +737,44 @@ def handle_vocs(vocs: list, vois: list, terra_df: pd.DataFrame, logger: logging.
         | (clades[col_names.get("pangolin_lineage")].isin(vois))
     ]
 
-    vocs_msg, vois_msg = None, None
-    for sample_df, label, list_, msg in zip(
-        (voc_samples, voi_samples), ("VOC", "VOI"), (vocs, vois), (vocs_msg, vois_msg)
+    for sample_df, label, list_ in zip(
+        (voc_samples, voi_samples), ("VOC", "VOI"), (vocs, vois)
     ):
         if sample_df.shape[0] > 0:
             samples = sample_df.index.values.tolist()
-            msg = "\n".join(
-                [
-                    (
-                        "The following samples were found to be in the designated "
-                        f"{label} list ({list_}): "
-                    ),
-                    *samples,
-                    (
-                        "Please notify the Epidemiologist group at "
-                        "'wgs-epi@doh.wa.gov' prior to upload to GISAID"
-                    ),
-                ]
+            events.add(f"{label.lower()}_hit", samples)
+            msg = (
+                f"{len(samples)} samples were found to be in the designated "
+                f"{label} list ({list_}). Please notify the Epidemiologist "
+                "group at 'wgs-epi@doh.wa.gov' prior to upload to GISAID"
             )
             logger.info(msg)
             print()
-    # Kind of janky solution to show which sample is which lineage:
-    # display in terminal, then write to separate TSV file
+    # Write the table of which sample is which lineage in the background,
+    # overlapping with the downloads, rather than displaying it in the terminal
     vocs_vois_df = pd.concat([voc_samples, voi_samples])
+    vocs_vois_future = None
     if vocs_vois_df.shape[0] > 0:
         outpath = os.path.join(OUTDIR, "vocs_vois_table.tsv")
-        vocs_vois_df.to_csv(outpath, sep="\t")
+        vocs_vois_future = report_executor.submit(
+            vocs_vois_df.to_csv, outpath, sep="\t"
+        )
         vocs_vois_out_msg = (
-            "The following table of samples "
+            "A table of these samples "
             "and Pango Linage/NextClade Clade "
-            f"was written to {outpath}."
+            f"is being written to {outpath}."
         )
         logger.info(vocs_vois_out_msg)
-        display(vocs_vois_df)
         print()
 
-    return voc_samples, voi_samples
+    return voc_samples, voi_samples, vocs_vois_future
 
 
 def main():
     """Run the functions of this script in order, to process data in 
     preparation for uploading to GISAID"""
     print()
+    pathlib.Path(OUTDIR).mkdir(parents=True, exist_ok=True)
     logger = setup_logger(OUTDIR)
     dashboard_df = load_tables(DASHBOARD_TABLE)
     terra_df = load_tables(TERRA_TABLE, terra_table=True)
@@ -592,43 +790,71 @@ def main():
             logger.critical(bad_input_message)
             sys.exit()
 
-    merged_df = merge_tables(terra_df, dashboard_df, logger=logger)
-    req_fields = ["collected_date"]
-    samples_missing_data = handle_missing_data(merged_df, req_fields, logger)
-    vocs, vois = get_vocs()
-    _, _ = handle_vocs(vocs, vois, merged_df, logger)
-    if not NO_AUTO_QC:
-        bad_samples = auto_qc(merged_df, logger)
-    else:
-        bad_samples = []
-
-    # Note: the assembly download execution step is the most
-    # Costly & time-intensive; comment out lines below if they're already present
-    print(
-        "Downloading consensus genome assemblies "
-        "from the cloud; this may take some time...",
-        end="\n",
-    )
-    failed_samples = samples_missing_data + bad_samples
+    events = SampleEvents()
+    # Only the VOC/VOI table is written in the background, while the
+    # assemblies download; the executor is drained on leaving this block
+    with ThreadPoolExecutor(max_workers=1) as report_executor:
+        merged_df = merge_tables(terra_df, dashboard_df, events, logger=logger)
+        merged_df, _ = resolve_duplicates(merged_df, DEDUP_BY, events, logger)
+        req_fields = ["collected_date"]
+        samples_missing_data = handle_missing_data(
+            merged_df, req_fields, events, logger
+        )
+        vocs, vois = get_vocs()
+        _, _, vocs_vois_future = handle_vocs(
+            vocs, vois, merged_df, events, report_executor, logger
+        )
+        if not NO_AUTO_QC:
+            bad_samples = auto_qc(merged_df, events, logger)
+        else:
+            bad_samples = []
+
+        # Note: the assembly download execution step is the most
+        # Costly & time-intensive; assemblies already in the store are reused
+        print(
+            "Downloading consensus genome assemblies "
+            "from the cloud; this may take some time...",
+            end="\n",
+        )
+        failed_samples = samples_missing_data + bad_samples
 
-    _, download_stderrs = download_assemblies(
-        merged_df[~merged_df["wa_no"].isin(failed_samples)]
-    )
-    missing_genomes = handle_missing_genomes(merged_df, download_stderrs, logger)
-    failed_samples.extend(missing_genomes)
-    fasta_generation_errs = generate_fasta(
-        merged_df[~merged_df["wa_no"].isin(failed_samples)], logger
-    )
-    failed_samples.extend(list(fasta_generation_errs.keys()))
-    new_df = (
-        prep_metadata(merged_df[~merged_df["wa_no"].isin(failed_samples)])
-        .droplevel(1, axis=1)
-        .set_index("submitter")
-    )
+        store_index, download_stderrs = download_assemblies(
+            merged_df[~merged_df["wa_no"].isin(failed_samples)]
+        )
+        missing_genomes = handle_missing_genomes(
+            merged_df, download_stderrs, events, logger
+        )
+        failed_samples.extend(missing_genomes)
+        fasta_generation_errs = generate_fasta(
+            merged_df[~merged_df["wa_no"].isin(failed_samples)],
+            store_index,
+            events,
+            logger,
+        )
+        failed_samples.extend(list(fasta_generation_errs.keys()))
+        new_df = (
+            prep_metadata(merged_df[~merged_df["wa_no"].isin(failed_samples)])
+            .droplevel(1, axis=1)
+            .set_index("submitter")
+        )
 
-    outpath = os.path.join(OUTDIR, "gisaid_metadata.csv")
-    new_df.to_csv(outpath)
-    logger.info(f"GISAID metadata file written to {outpath}")
+        outpath = os.path.join(OUTDIR, "gisaid_metadata.csv")
+        new_df.to_csv(outpath)
+        logger.info(f"GISAID metadata file written to {outpath}")
+
+    if vocs_vois_future is not None:
+        vocs_vois_future.result()
+
+    write_reports(events)
+    event_counts = events.counts()
+    event_counts = event_counts[event_counts > 0]
+    if event_counts.shape[0] > 0:
+        logger.info(
+            "Samples affected by each event (details in sample_events.tsv):\n"
+            + event_counts.to_string()
+        )
+        print()
+    logger.info(f"Sample event reports written to {OUTDIR}")
 
     print("Done", end="\n\n")
 